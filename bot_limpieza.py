@@ -1,9 +1,9 @@
 import os
 import logging
 import gspread
-import time
 import json
 import sys
+import cuota_google
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 
@@ -50,9 +50,9 @@ def autenticar_google():
 def obtener_ids_validos(gc):
     """Obtiene los IDs de la hoja principal."""
     try:
-        sh = gc.open_by_key(Config.ID_HOJA_CALCULO)
-        ws = sh.get_worksheet(0)
-        raw_ids = ws.col_values(Config.COLUMNA_ID)[1:] # Ignorar encabezado
+        sh = cuota_google.ejecutar("sheets_lectura", gc.open_by_key, Config.ID_HOJA_CALCULO)
+        ws = cuota_google.ejecutar("sheets_lectura", sh.get_worksheet, 0)
+        raw_ids = cuota_google.ejecutar("sheets_lectura", ws.col_values, Config.COLUMNA_ID)[1:] # Ignorar encabezado
         lista_limpia = set([str(x).strip() for x in raw_ids if str(x).strip()])
         return lista_limpia, sh
     except Exception as e:
@@ -66,7 +66,7 @@ def obtener_carpetas_drive(drive_service):
     try:
         while True:
             q = f"'{Config.ID_CARPETA_DRIVE_DESTINO}' in parents and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-            res = drive_service.files().list(q=q, fields='nextPageToken, files(id, name)', pageToken=page_token, supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
+            res = cuota_google.ejecutar("drive", drive_service.files().list(q=q, fields='nextPageToken, files(id, name)', pageToken=page_token, supportsAllDrives=True, includeItemsFromAllDrives=True).execute)
             for f in res.get('files', []):
                 mapa_carpetas[f['name']] = f['id']
             page_token = res.get('nextPageToken', None)
@@ -78,16 +78,16 @@ def obtener_carpetas_drive(drive_service):
 def gestionar_hoja_log(sh):
     """Obtiene o crea la hoja de registro de borrados."""
     try:
-        ws_log = sh.worksheet(Config.NOMBRE_HOJA_LOG)
+        ws_log = cuota_google.ejecutar("sheets_lectura", sh.worksheet, Config.NOMBRE_HOJA_LOG)
     except:
         logging.info("📝 Creando hoja de registro 'PAPELERA_LOG'...")
-        ws_log = sh.add_worksheet(title=Config.NOMBRE_HOJA_LOG, rows=1000, cols=2)
-        ws_log.append_row(["ID_MP", "ESTADO"])
+        ws_log = cuota_google.ejecutar("sheets_escritura", sh.add_worksheet, title=Config.NOMBRE_HOJA_LOG, rows=1000, cols=2)
+        cuota_google.ejecutar("sheets_escritura", ws_log.append_row, ["ID_MP", "ESTADO"])
     
-    raw_log = ws_log.col_values(1)[1:]
+    raw_log = cuota_google.ejecutar("sheets_lectura", ws_log.col_values, 1)[1:]
     return ws_log, set([str(x).strip() for x in raw_log if str(x).strip()])
 
-def main():
+def ejecutar_limpieza():
     logging.info("🧹 INICIANDO PROTOCOLO DE LIMPIEZA (SISTEMA DE STRIKES)...")
     gc, drive = autenticar_google()
     
@@ -120,8 +120,8 @@ def main():
         logging.info("✨ Drive está limpio. No sobran carpetas.")
         # Si la lista negra tiene datos pero drive está limpio, limpiamos la lista
         if ids_en_capilla:
-            ws_log.clear()
-            ws_log.append_row(["ID_MP", "ESTADO"])
+            cuota_google.ejecutar("sheets_escritura", ws_log.clear)
+            cuota_google.ejecutar("sheets_escritura", ws_log.append_row, ["ID_MP", "ESTADO"])
         return
 
     logging.info(f"⚠️ Se detectaron {len(huerfanos)} carpetas sobrantes.")
@@ -133,9 +133,8 @@ def main():
             folder_id = carpetas_drive[huerfano]
             logging.warning(f"🗑️ [STRIKE 2] Eliminando carpeta confirmada: {huerfano}")
             try:
-                drive.files().delete(fileId=folder_id, supportsAllDrives=True).execute()
+                cuota_google.ejecutar("drive_escritura", drive.files().delete(fileId=folder_id, supportsAllDrives=True).execute)
                 ids_eliminados.append(huerfano)
-                time.sleep(0.5) 
             except Exception as e:
                 logging.error(f"❌ Error borrando {huerfano}: {e}")
         else:
@@ -147,17 +146,15 @@ def main():
     
     # A) Agregar los nuevos Strike 1 al final
     if nuevos_en_capilla:
-        ws_log.append_rows(nuevos_en_capilla)
+        cuota_google.ejecutar("sheets_escritura", ws_log.append_rows, nuevos_en_capilla)
         
     # B) Perdonar a los que volvieron a ser válidos
     ids_perdonados = [x for x in ids_en_capilla if x not in huerfanos]
     
     # Si borramos algo o perdonamos algo, hay que reescribir la hoja de log para limpiarla
     if ids_eliminados or ids_perdonados:
-        time.sleep(2)
-        
-        # Re-leemos el log completo actualizado
-        lista_actualizada = ws_log.col_values(1)[1:] 
+        # Re-leemos el log completo actualizado (el ritmo lo controla cuota_google)
+        lista_actualizada = cuota_google.ejecutar("sheets_lectura", ws_log.col_values, 1)[1:] 
         
         ids_finales = []
         for item in lista_actualizada:
@@ -165,15 +162,22 @@ def main():
                 ids_finales.append([item, "STRIKE_1"])
         
         # Reescribimos la hoja completa
-        ws_log.clear()
-        ws_log.append_row(["ID_MP", "ESTADO"])
+        cuota_google.ejecutar("sheets_escritura", ws_log.clear)
+        cuota_google.ejecutar("sheets_escritura", ws_log.append_row, ["ID_MP", "ESTADO"])
         if ids_finales:
-            ws_log.append_rows(ids_finales)
+            cuota_google.ejecutar("sheets_escritura", ws_log.append_rows, ids_finales)
 
     if ids_perdonados:
         logging.info(f"🛡️ Se perdonaron {len(ids_perdonados)} carpetas que volvieron a ser válidas.")
     
     logging.info("✅ Proceso de limpieza finalizado.")
 
+def main():
+    # El reporte de cuota se emite aunque la limpieza aborte o falle
+    try:
+        ejecutar_limpieza()
+    finally:
+        cuota_google.reportar()
+
 if __name__ == "__main__":
     main()
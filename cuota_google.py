@@ -0,0 +1,174 @@
+import os
+import time
+import json
+import random
+import fcntl
+import logging
+import tempfile
+import threading
+from collections import deque
+
+# --- GESTOR DE CUOTA DE APIS DE GOOGLE ---
+# Toda llamada a Sheets o Drive de ambos bots pasa por ejecutar(), que:
+#   1. Espera un token del cubo de la API (ritmo bajo la cuota publicada).
+#   2. Reintenta con espera exponencial si Google responde 429 / rateLimitExceeded.
+#   3. Registra la llamada para el reporte de ritmo al final de la ejecución.
+# El estado de los cubos vive en un archivo con bloqueo (fcntl), así que todos
+# los procesos del mismo host (clones --lote, bot de limpieza) comparten el presupuesto.
+
+class ConfigCuota:
+    # Cuotas publicadas por Google (solicitudes por minuto).
+    # La cuota por usuario es la que manda: todos los bots usan la misma cuenta de servicio.
+    LIMITES = {
+        "sheets_lectura":   {"por_minuto": 300,   "por_usuario_minuto": 60},
+        "sheets_escritura": {"por_minuto": 300,   "por_usuario_minuto": 60},
+        "drive":            {"por_minuto": 12000, "por_usuario_minuto": 12000},
+        # Drive no publica cuota de escritura, pero recomienda no superar ~3 escrituras/seg sostenidas
+        "drive_escritura":  {"por_minuto": 180,   "por_usuario_minuto": 180},
+    }
+
+    # Margen para no rozar el límite (otros clientes de la misma cuenta, relojes desfasados)
+    FACTOR_SEGURIDAD = 0.9
+    # Ráfaga máxima permitida (segundos de cuota acumulable en el cubo)
+    SEGUNDOS_RAFAGA = 5
+
+    # Reintentos ante 429
+    REINTENTOS_429 = 5
+    ESPERA_BASE_429 = 2
+    ESPERA_MAX_429 = 64
+
+    RUTA_ESTADO = os.environ.get("CUOTA_ESTADO", os.path.join(tempfile.gettempdir(), "cuota_google_estado.json"))
+
+    @staticmethod
+    def tasa_por_segundo(api):
+        limites = ConfigCuota.LIMITES[api]
+        por_minuto = min(limites["por_minuto"], limites["por_usuario_minuto"])
+        return por_minuto * ConfigCuota.FACTOR_SEGURIDAD / 60.0
+
+# --- CUBO DE TOKENS COMPARTIDO ---
+
+def _leer_estado(f):
+    f.seek(0)
+    contenido = f.read()
+    if not contenido: return {}
+    try: return json.loads(contenido)
+    except ValueError: return {}
+
+def _guardar_estado(f, estado):
+    f.seek(0)
+    f.truncate()
+    f.write(json.dumps(estado))
+    f.flush()
+
+def tomar_token(api, costo=1):
+    """Bloquea hasta que el cubo de la API tenga 'costo' tokens disponibles y los consume."""
+    tasa = ConfigCuota.tasa_por_segundo(api)
+    capacidad = max(costo, tasa * ConfigCuota.SEGUNDOS_RAFAGA)
+    esperado = 0.0
+
+    while True:
+        with open(ConfigCuota.RUTA_ESTADO, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                estado = _leer_estado(f)
+                ahora = time.time()
+                cubo = estado.get(api, {"tokens": capacidad, "ts": ahora})
+                tokens = min(capacidad, cubo["tokens"] + (ahora - cubo["ts"]) * tasa)
+
+                if tokens >= costo:
+                    estado[api] = {"tokens": tokens - costo, "ts": ahora}
+                    _guardar_estado(f, estado)
+                    return esperado
+
+                estado[api] = {"tokens": tokens, "ts": ahora}
+                _guardar_estado(f, estado)
+                espera = (costo - tokens) / tasa
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        time.sleep(espera)
+        esperado += espera
+
+# --- ESTADÍSTICAS DE LA EJECUCIÓN ---
+
+_lock_stats = threading.Lock()
+_inicio_ejecucion = time.time()
+_llamadas = {}      # api -> deque de timestamps
+_esperas = {}       # api -> segundos totales esperando token
+_errores_429 = {}   # api -> cantidad de 429 recibidos
+
+def _registrar(api, espera):
+    with _lock_stats:
+        _llamadas.setdefault(api, deque()).append(time.time())
+        _esperas[api] = _esperas.get(api, 0.0) + espera
+
+def _es_error_cuota(e):
+    """Detecta 429 / rateLimitExceeded tanto de googleapiclient como de gspread."""
+    estado = None
+    resp = getattr(e, "resp", None)          # googleapiclient.errors.HttpError
+    if resp is not None: estado = getattr(resp, "status", None)
+    response = getattr(e, "response", None)  # gspread.exceptions.APIError
+    if estado is None and response is not None: estado = getattr(response, "status_code", None)
+
+    try: estado = int(estado)
+    except (TypeError, ValueError): return False
+
+    if estado == 429: return True
+    if estado == 403:
+        texto = str(e)
+        return "rateLimitExceeded" in texto or "userRateLimitExceeded" in texto
+    return False
+
+def ejecutar(api, funcion, *args, **kwargs):
+    """Ejecuta una llamada a Google respetando la cuota de 'api'.
+
+    Ej: ejecutar("drive", drive.files().list(q=q).execute)
+        ejecutar("sheets_escritura", worksheet.update_cell, fila, col, valor)
+    """
+    for intento in range(ConfigCuota.REINTENTOS_429 + 1):
+        espera = tomar_token(api)
+        _registrar(api, espera)
+        try:
+            return funcion(*args, **kwargs)
+        except Exception as e:
+            if not _es_error_cuota(e) or intento >= ConfigCuota.REINTENTOS_429:
+                raise
+            with _lock_stats:
+                _errores_429[api] = _errores_429.get(api, 0) + 1
+            pausa = min(ConfigCuota.ESPERA_MAX_429, ConfigCuota.ESPERA_BASE_429 * (2 ** intento)) + random.uniform(0, 1)
+            logging.warning(f"⏳ [Cuota] 429 en {api}. Reintento {intento + 1}/{ConfigCuota.REINTENTOS_429} en {pausa:.1f}s...")
+            time.sleep(pausa)
+
+def _pico_por_minuto(marcas):
+    """Máximo de llamadas dentro de cualquier ventana de 60 segundos."""
+    pico, ventana = 0, deque()
+    for t in marcas:
+        ventana.append(t)
+        while ventana[0] < t - 60: ventana.popleft()
+        pico = max(pico, len(ventana))
+    return pico
+
+def resumen():
+    """Devuelve {api: {total, pico_por_minuto, promedio_por_minuto, espera_seg, errores_429}}."""
+    # Al menos 1 minuto: una corrida corta no se extrapola y el promedio nunca supera al pico
+    minutos = max((time.time() - _inicio_ejecucion) / 60.0, 1.0)
+    with _lock_stats:
+        return {
+            api: {
+                "total": len(marcas),
+                "pico_por_minuto": _pico_por_minuto(marcas),
+                "promedio_por_minuto": round(len(marcas) / minutos, 2),
+                "espera_seg": round(_esperas.get(api, 0.0), 1),
+                "errores_429": _errores_429.get(api, 0),
+            }
+            for api, marcas in _llamadas.items()
+        }
+
+def reportar():
+    datos = resumen()
+    if not datos:
+        logging.info("📈 [Cuota] No se realizaron llamadas a Google.")
+        return
+    logging.info("📈 [Cuota] Ritmo de solicitudes de esta ejecución:")
+    for api, d in sorted(datos.items()):
+        logging.info(f"   - {api}: {d['total']} llamadas | pico {d['pico_por_minuto']}/min | promedio {d['promedio_por_minuto']}/min | espera {d['espera_seg']}s | 429: {d['errores_429']}")
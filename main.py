@@ -9,6 +9,12 @@ import argparse
 import sys
 import json
 import re  # Para sanitizar nombres
+import socket
+import threading
+import signal
+import cuota_google
+import perfilado
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
@@ -19,7 +25,7 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import UnexpectedAlertPresentException, TimeoutException
+from selenium.common.exceptions import UnexpectedAlertPresentException, TimeoutException, NoSuchElementException, JavascriptException, WebDriverException
 
 # NOTA: Se eliminó 'webdriver_manager' porque usaremos el del sistema (ARM64)
 
@@ -36,14 +42,29 @@ class Config:
     COLUMNA_ID = 2
     COLUMNA_ENLACE = 15
     COLUMNA_PRIORIDAD = 16
+    COLUMNA_ARRIENDO = 17
 
     # Parámetros de Ejecución
     TAMANO_LOTE = 25
     REINTENTOS_PROCESO = 1
 
+    # Arriendo de filas entre runners (--arriendo)
+    TAMANO_ARRIENDO = 5                 # Filas por tanda: tandas chicas reparten mejor la carga
+    DURACION_ARRIENDO = 15 * 60         # Segundos; se renueva cada tercio de este tiempo
+    ENFRIAMIENTO_ARRIENDO = 4 * 3600    # Una fila terminada no se vuelve a tomar antes de esto
+    ESPERA_VERIFICACION_ARRIENDO = 3
+
     # Configuración de Selenium
     SELENIUM_TIMEOUT = 20 
     PAGE_LOAD_TIMEOUT = 60
+    INTERVALO_SONDEO = 0.5  # Igual que el poll_frequency por defecto de WebDriverWait
+
+    # Modo multipestaña: si Chromium/chromedriver muere se relanza y lo que estaba en curso se reintenta
+    MAX_REINICIOS_NAVEGADOR = 3     # Por lote
+    DEVOLUCIONES_POR_CAIDA = 1      # Veces que una licitación vuelve a la cola antes de marcarse fallida
+
+    # Se inyecta en cada página para ocultar la automatización
+    SCRIPT_FURTIVO = "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
 
     # Inicializar Logging Globalmente
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%H:%M:%S')
@@ -67,9 +88,32 @@ def limpiar_nombre_archivo(nombre):
 parser = argparse.ArgumentParser(description='Bot Licitaciones Paralelo')
 parser.add_argument('--lote', type=int, default=1, help='Número del clon actual (ej: 1)')
 parser.add_argument('--total_lotes', type=int, default=1, help='Total de clones corriendo (ej: 2)')
+parser.add_argument('--arriendo', action='store_true', help='Toma filas por arriendo en la hoja (ignora --lote/--total_lotes para repartir)')
+parser.add_argument('--pestanas', type=int, default=1, help='Licitaciones simultáneas en pestañas de un mismo navegador (1 = modo clásico)')
+parser.add_argument('--perfil', action='store_true', help='Activa el perfilado de memoria por licitación')
+parser.add_argument('--perfil_cpu', choices=['ninguno', 'cprofile', 'muestreo'], default='ninguno', help='Perfil de CPU para las licitaciones seleccionadas (activa --perfil)')
+parser.add_argument('--perfil_ids', default='', help='IDs a perfilar en CPU, separados por coma (vacío = todos)')
+parser.add_argument('--perfil_dir', default='reportes_perfil', help='Carpeta donde se guardan los reportes de perfilado')
 ARGS, unknown = parser.parse_known_args()
-
-CARPETA_TEMP = Config.get_temp_folder(ARGS.lote if ARGS.total_lotes > 1 else None)
+if ARGS.perfil_ids and ARGS.perfil_cpu == 'ninguno':
+    parser.error("--perfil_ids requiere --perfil_cpu cprofile|muestreo")
+if ARGS.perfil_cpu != 'ninguno' and ARGS.pestanas > 1:
+    # El perfil de CPU cubre todo el hilo principal, donde se intercalan todas las pestañas
+    parser.error("--perfil_cpu no es compatible con --pestanas > 1 (el perfil mezclaría las licitaciones de todas las pestañas)")
+
+# Con --arriendo varios runners pueden compartir host (y cwd): cada proceso usa su propia carpeta
+if ARGS.arriendo:
+    CARPETA_TEMP = Config.get_temp_folder(f"arriendo_{os.getpid()}")
+else:
+    CARPETA_TEMP = Config.get_temp_folder(ARGS.lote if ARGS.total_lotes > 1 else None)
+
+PERFIL = perfilado.Perfilador(
+    activo=ARGS.perfil or ARGS.perfil_cpu != 'ninguno',
+    carpeta=ARGS.perfil_dir,
+    ids_cpu=[x.strip() for x in ARGS.perfil_ids.split(',') if x.strip()],
+    modo_cpu=ARGS.perfil_cpu,
+    etiqueta=f"lote{ARGS.lote}",
+)
 
 # --- CONEXIÓN ---
 
@@ -102,7 +146,7 @@ def autenticar_google():
         logging.error(f"❌ Error al autenticar: {e}")
         sys.exit(1)
 
-def iniciar_navegador():
+def iniciar_navegador(estrategia_carga='normal'):
     if not os.path.exists(CARPETA_TEMP): os.makedirs(CARPETA_TEMP)
     for f in os.listdir(CARPETA_TEMP):
         try: os.remove(os.path.join(CARPETA_TEMP, f))
@@ -127,7 +171,7 @@ def iniciar_navegador():
         "profile.managed_default_content_settings.stylesheets": 1,
     }
     opciones.add_experimental_option("prefs", preferencias)
-    opciones.page_load_strategy = 'normal' 
+    opciones.page_load_strategy = estrategia_carga
     
     # --- MODO FURTIVO ---
     opciones.add_argument("--disable-blink-features=AutomationControlled") 
@@ -162,7 +206,7 @@ def iniciar_navegador():
         service = Service(executable_path=driver_path)
         driver = webdriver.Chrome(service=service, options=opciones)
         
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        driver.execute_script(Config.SCRIPT_FURTIVO)
         driver.set_page_load_timeout(Config.PAGE_LOAD_TIMEOUT)
         return driver
     except Exception as e:
@@ -179,7 +223,7 @@ def obtener_nombres_carpetas_existentes(drive_service):
     try:
         while True:
             q = f"'{Config.ID_CARPETA_DRIVE_DESTINO}' in parents and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-            response = drive_service.files().list(q=q, fields='nextPageToken, files(name)', pageToken=page_token, supportsAllDrives=True, includeItemsFromAllDrives=True, pageSize=1000).execute()
+            response = cuota_google.ejecutar("drive", drive_service.files().list(q=q, fields='nextPageToken, files(name)', pageToken=page_token, supportsAllDrives=True, includeItemsFromAllDrives=True, pageSize=1000).execute)
             for file in response.get('files', []):
                 nombres_existentes.add(file.get('name'))
             page_token = response.get('nextPageToken', None)
@@ -191,15 +235,15 @@ def obtener_nombres_carpetas_existentes(drive_service):
 def obtener_o_crear_carpeta_destino(drive_service, id_mp, id_padre):
     try:
         q = f"'{id_padre}' in parents and name = '{id_mp}' and trashed = false"
-        res = drive_service.files().list(q=q, fields="files(id, webViewLink)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
+        res = cuota_google.ejecutar("drive", drive_service.files().list(q=q, fields="files(id, webViewLink)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute)
         files = res.get('files', [])
         
         if files: 
             return files[0]['id'], files[0].get('webViewLink'), False 
         else:
             metadata = {'name': id_mp, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [id_padre]}
-            file = drive_service.files().create(body=metadata, fields='id, webViewLink', supportsAllDrives=True).execute()
-            try: drive_service.permissions().create(fileId=file.get('id'), body={'type': 'anyone', 'role': 'reader'}, supportsAllDrives=True).execute()
+            file = cuota_google.ejecutar("drive_escritura", drive_service.files().create(body=metadata, fields='id, webViewLink', supportsAllDrives=True).execute)
+            try: cuota_google.ejecutar("drive_escritura", drive_service.permissions().create(fileId=file.get('id'), body={'type': 'anyone', 'role': 'reader'}, supportsAllDrives=True).execute)
             except Exception as e: logging.warning(f"No se pudo hacer pública la carpeta {id_mp}: {e}")
             return file.get('id'), file.get('webViewLink'), True 
     except Exception as e:
@@ -207,16 +251,17 @@ def obtener_o_crear_carpeta_destino(drive_service, id_mp, id_padre):
         return None, None, False
 
 def subir_archivo_rapido(drive_service, ruta_local, metadatos):
+    """Sub-flujo (usar con 'yield from'): la pausa antes del reintento se cede al planificador."""
     try:
         media = MediaFileUpload(ruta_local, resumable=True)
-        drive_service.files().create(body=metadatos, media_body=media, fields='id', supportsAllDrives=True).execute()
+        cuota_google.ejecutar("drive_escritura", drive_service.files().create(body=metadatos, media_body=media, fields='id', supportsAllDrives=True).execute)
         return True
     except Exception as e1:
         logging.warning(f"Primer intento de subida falló para {ruta_local}. Reintentando... Error: {e1}")
-        time.sleep(2)
+        yield 2
         try:
             media = MediaFileUpload(ruta_local, resumable=True)
-            drive_service.files().create(body=metadatos, media_body=media, fields='id', supportsAllDrives=True).execute()
+            cuota_google.ejecutar("drive_escritura", drive_service.files().create(body=metadatos, media_body=media, fields='id', supportsAllDrives=True).execute)
             return True
         except Exception as e2:
             logging.error(f"Falló la subida de {ruta_local} en el reintento. Error: {e2}")
@@ -226,10 +271,45 @@ def limpiar_carpetas_obsoletas(drive_service, ids_excel_validos):
     pass 
 
 # --- UTILIDADES ---
+# Las esperas son sub-flujos cooperativos: ceden (yield) los segundos a pausar en lugar
+# de dormir, para que el modo multipestaña atienda otra pestaña mientras tanto.
+# Se usan con 'yield from' dentro de flujo_licitacion.
 
 def espera_humana(min_seg=2.0, max_seg=4.0):
-    tiempo = random.uniform(min_seg, max_seg)
-    time.sleep(tiempo)
+    yield random.uniform(min_seg, max_seg)
+
+def esperar_hasta(driver, condicion, timeout):
+    """Equivalente cooperativo de WebDriverWait(driver, timeout).until(condicion)."""
+    limite = time.time() + timeout
+    while True:
+        try:
+            valor = condicion(driver)
+            if valor: return valor
+        except NoSuchElementException:
+            pass
+        if time.time() > limite:
+            raise TimeoutException(f"Condición no cumplida en {timeout}s")
+        yield Config.INTERVALO_SONDEO
+
+def marcar_documento_actual(driver):
+    # Con page_load_strategy 'none' driver.get() vuelve antes de que la navegación reemplace el
+    # documento: la marca permite distinguir el documento anterior (about:blank o la ficha de un
+    # intento previo) del nuevo, que nace sin ella.
+    driver.execute_script("window.__documentoPrevio = true")
+
+def pagina_cargada(driver):
+    try:
+        return driver.execute_script("return !window.__documentoPrevio && document.readyState === 'complete'")
+    except JavascriptException:
+        return False  # El documento se reemplazó en medio del script
+    except WebDriverException as e:
+        # Mientras la navegación se confirma no hay contexto de ejecución: aún no está cargada
+        if es_error_transitorio_navegacion(e): return False
+        raise
+
+def es_error_transitorio_navegacion(e):
+    texto = str(e).lower()
+    return any(m in texto for m in ("execution context", "cannot find context", "target frame detached", "frame was detached"))
 
 def esperar_nuevo_archivo(carpeta, cantidad_antes, timeout=20): 
     inicio = time.time() 
@@ -237,7 +317,7 @@ def esperar_nuevo_archivo(carpeta, cantidad_antes, timeout=20):
         actuales = len(os.listdir(carpeta))
         if actuales > cantidad_antes:
             return True
-        time.sleep(0.3)
+        yield 0.3
     return False
 
 def esperar_fin_todas_descargas(carpeta, timeout=120): 
@@ -247,17 +327,25 @@ def esperar_fin_todas_descargas(carpeta, timeout=120):
         if not archivos: return True 
         descargando = [f for f in archivos if f.endswith('.crdownload') or f.endswith('.tmp')]
         if not descargando:
-            time.sleep(1)
+            yield 1
             if not [f for f in os.listdir(carpeta) if f.endswith('.crdownload') or f.endswith('.tmp')]:
                 return True
-        time.sleep(1)
+        yield 1
     return False
 
+def ejecutar_flujo(flujo):
+    """Ejecuta un flujo cooperativo de forma secuencial: cada pausa cedida es un sleep real."""
+    try:
+        while True:
+            time.sleep(next(flujo))
+    except StopIteration as fin:
+        return fin.value
+
 def escribir_enlace_seguro(worksheet, id_mp, link_carpeta):
     try:
-        celda = worksheet.find(id_mp, in_column=Config.COLUMNA_ID)
+        celda = cuota_google.ejecutar("sheets_lectura", worksheet.find, id_mp, in_column=Config.COLUMNA_ID)
         if celda:
-            worksheet.update_cell(celda.row, Config.COLUMNA_ENLACE, link_carpeta)
+            cuota_google.ejecutar("sheets_escritura", worksheet.update_cell, celda.row, Config.COLUMNA_ENLACE, link_carpeta)
             return True
     except Exception as e:
         logging.error(f"Error al escribir enlace para {id_mp} en la hoja: {e}")
@@ -266,12 +354,12 @@ def escribir_enlace_seguro(worksheet, id_mp, link_carpeta):
 def actualizar_prioridad(worksheet, id_mp, valor):
     logging.info(f"   -> [Sheet] Actualizando '{id_mp}' a '{valor}'...")
     try:
-        celda = worksheet.find(id_mp, in_column=Config.COLUMNA_ID)
+        celda = cuota_google.ejecutar("sheets_lectura", worksheet.find, id_mp, in_column=Config.COLUMNA_ID)
         if not celda:
-            celda = worksheet.find(id_mp.strip(), in_column=Config.COLUMNA_ID)
+            celda = cuota_google.ejecutar("sheets_lectura", worksheet.find, id_mp.strip(), in_column=Config.COLUMNA_ID)
 
         if celda:
-            worksheet.update_cell(celda.row, Config.COLUMNA_PRIORIDAD, valor)
+            cuota_google.ejecutar("sheets_escritura", worksheet.update_cell, celda.row, Config.COLUMNA_PRIORIDAD, valor)
             logging.info(f"      ✅ ÉXITO (Fila {celda.row} actualizada).")
             return True
         else:
@@ -298,9 +386,14 @@ def manejar_alertas(driver):
 
 def obtener_datos_licitaciones(gc_client):
     logging.info("📊 Leyendo datos de Google Sheet...")
-    sh = gc_client.open_by_key(Config.ID_HOJA_CALCULO)
-    worksheet = sh.get_worksheet(0) 
-    datos = worksheet.get_all_values()
+    sh = cuota_google.ejecutar("sheets_lectura", gc_client.open_by_key, Config.ID_HOJA_CALCULO)
+    worksheet = cuota_google.ejecutar("sheets_lectura", sh.get_worksheet, 0)
+    datos = cuota_google.ejecutar("sheets_lectura", worksheet.get_all_values)
+    lista, ids_validos = parsear_licitaciones(datos)
+    logging.info(f"Se encontraron {len(lista)} licitaciones en la hoja.")
+    return lista, ids_validos, worksheet
+
+def parsear_licitaciones(datos):
     lista = []
     ids_validos = set()
     
@@ -308,23 +401,186 @@ def obtener_datos_licitaciones(gc_client):
         if len(fila) >= Config.COLUMNA_ID and fila[Config.COLUMNA_URL - 1] and fila[Config.COLUMNA_ID - 1]:
             id_limpio = fila[Config.COLUMNA_ID - 1].strip()
             prioridad = fila[Config.COLUMNA_PRIORIDAD - 1].strip() if len(fila) >= Config.COLUMNA_PRIORIDAD else ""
+            arriendo = fila[Config.COLUMNA_ARRIENDO - 1].strip() if len(fila) >= Config.COLUMNA_ARRIENDO else ""
             lista.append({
                 "url_ficha": fila[Config.COLUMNA_URL - 1].strip(),
                 "id_mp": id_limpio,
-                "prioridad": prioridad
+                "prioridad": prioridad,
+                "fila": i + 2,  # +1 por el encabezado, +1 porque la hoja es base 1
+                "arriendo": arriendo
             })
             ids_validos.add(id_limpio)
             
-    logging.info(f"Se encontraron {len(lista)} licitaciones en la hoja.")
-    return lista, ids_validos, worksheet
+    return lista, ids_validos
+
+def flujo_licitacion(driver, licitacion, pestana, drive_service, worksheet, cola):
+    """Procesa una licitación en la pestaña indicada. Es un generador: cede los segundos de cada
+    pausa (carga, descargas, esperas humanas). Devuelve True si termina bien; lanza excepción si falla."""
+    id_mp = licitacion['id_mp']
+    carpeta = pestana['carpeta']
+
+    # --- PREPARACIÓN CARPETAS ---
+    id_carpeta_destino, link_carpeta, es_nueva = obtener_o_crear_carpeta_destino(drive_service, id_mp, Config.ID_CARPETA_DRIVE_DESTINO)
+    if link_carpeta: escribir_enlace_seguro(worksheet, id_mp, link_carpeta)
+
+    mapa_archivos_drive = {}
+    if id_carpeta_destino and not es_nueva:
+        res = cuota_google.ejecutar("drive", drive_service.files().list(q=f"'{id_carpeta_destino}' in parents and trashed=false", fields="files(id, name)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute)
+        for f in res.get('files', []): mapa_archivos_drive[f['name'].lower()] = f['id']
+
+    ventana_principal = pestana['principal']
+    
+    # --- NAVEGACIÓN ---
+    logging.info(f"   -> 🌍 [{id_mp}] Navegando a ficha...")
+    marcar_documento_actual(driver)
+    driver.get(licitacion['url_ficha'])
+    yield from esperar_hasta(driver, pagina_cargada, Config.PAGE_LOAD_TIMEOUT)
+    yield from espera_humana(2, 4)
+
+    if "forbidden" in driver.title.lower() or "access denied" in driver.page_source.lower():
+        raise Exception("Bloqueo 403 en Ficha Principal")
+
+    manejar_alertas(driver)
+    yield from espera_humana(1, 2)
+    
+    try:
+        btn_adj = yield from esperar_hasta(driver, EC.element_to_be_clickable((By.ID, "imgAdjuntos")), Config.SELENIUM_TIMEOUT)
+        btn_adj.click()
+        
+        yield from esperar_hasta(driver, lambda d: len(ventanas_de_pestana(d, pestana)) == 2, Config.SELENIUM_TIMEOUT)
+        ventanas = ventanas_de_pestana(driver, pestana)
+        driver.switch_to.window([v for v in ventanas if v != ventana_principal][0])
+        
+        yield from espera_humana(3, 5) 
+
+        if "forbidden" in driver.title.lower() or "access denied" in driver.page_source.lower():
+            raise Exception("Bloqueo 403 en Popup")
+
+    except UnexpectedAlertPresentException:
+        manejar_alertas(driver)
+        logging.warning(f"   -> ⚠️ [{id_mp}] Alerta web detectada")
+        raise 
+    except Exception as e:
+        if len(ventanas_de_pestana(driver, pestana)) > 1: driver.close(); driver.switch_to.window(ventana_principal)
+        logging.error(f"   -> ❌ [{id_mp}] Error abriendo adjuntos: {e}")
+        raise 
 
-def procesar_lote(lote_datos, drive_service, worksheet):
+    xpath_btns = "//input[contains(@id, 'DWNL_grdId') and @type='image']"
+    try:
+        yield from esperar_hasta(driver, EC.presence_of_element_located((By.XPATH, xpath_btns)), Config.SELENIUM_TIMEOUT)
+        btns = [e for e in driver.find_elements(By.XPATH, xpath_btns) if e.is_displayed()]
+        if not btns: raise Exception("Sin botones")
+    except Exception:
+        logging.warning(f"   -> Ø [{id_mp}] No se encontraron botones (Vacío/Timeout)")
+        driver.close(); driver.switch_to.window(ventana_principal)
+        raise 
+
+    for f in os.listdir(carpeta):
+        try: os.remove(os.path.join(carpeta, f))
+        except: pass
+    
+    cola.clear()
+    botones_a_clic = []
+
+    # 1. SELECCIÓN
+    for btn in btns:
+        desc_limpia = ""
+        try:
+            celdas = btn.find_element(By.XPATH, "./ancestor::tr").find_elements(By.TAG_NAME, "td")
+            if len(celdas) >= 5: 
+                txt = celdas[4].text.strip()
+                # USO DE LA FUNCIÓN DE SANITIZACIÓN SEGURA
+                desc_limpia = limpiar_nombre_archivo(txt)[:80]
+        except: pass
+
+        if desc_limpia and len(desc_limpia) > 3:
+            if any(desc_limpia.lower() in nom for nom in mapa_archivos_drive): continue 
+        
+        botones_a_clic.append((btn, desc_limpia))
+
+    if not botones_a_clic:
+        logging.info(f"   -> ✅ [{id_mp}] Sin archivos nuevos que descargar.")
+        driver.close(); driver.switch_to.window(ventana_principal)
+        return True
+
+    logging.info(f"   -> ⬇️ [{id_mp}] Descargando {len(botones_a_clic)} archivos...")
+
+    archivos_antes_del_loop = 0 
+    contador_saturacion = 0 
+    
+    # 2. DESCARGA
+    for btn, desc in botones_a_clic:
+        if contador_saturacion > 0 and contador_saturacion % 5 == 0:
+            wait_long = random.randint(10, 15)
+            yield wait_long
+        
+        contador_saturacion += 1
+        
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn)
+        yield from espera_humana(2.0, 4.0)
+        
+        try: btn.click()
+        except: 
+            try: ActionChains(driver).move_to_element(btn).click().perform()
+            except: pass
+        
+        if manejar_alertas(driver): continue
+
+        if (yield from esperar_nuevo_archivo(carpeta, archivos_antes_del_loop, timeout=25)):
+            yield 1.0
+            archivos_ahora = os.listdir(carpeta)
+            archivos_en_cola = [c['temp'] for c in cola]
+            nuevo_nombre = next((f for f in archivos_ahora if f not in archivos_en_cola), None)
+            if nuevo_nombre:
+                cola.append({"temp": nuevo_nombre, "desc": desc})
+                archivos_antes_del_loop += 1
+            else: logging.warning(f"      ? [{id_mp}] Archivo fantasma")
+        else: logging.warning(f"      x [{id_mp}] Falló descarga de un archivo")
+        
+    # 3. SUBIDA
+    yield from esperar_fin_todas_descargas(carpeta, timeout=120)
+
+    intentos_extra = 0
+    while len(os.listdir(carpeta)) < len(botones_a_clic) and intentos_extra < 3:
+        yield 1; intentos_extra += 1
+    
+    logging.info(f"   -> ☁️ [{id_mp}] Subiendo a Drive...")
+
+    archivos_disco = set(os.listdir(carpeta))
+    
+    for item in cola:
+        base = item['temp'].replace('.crdownload', '').replace('.tmp', '')
+        real = next((f for f in archivos_disco if f.startswith(base)), None)
+        
+        if real:
+            if real in archivos_disco: archivos_disco.remove(real)
+            # NOMBRE FINAL SANITIZADO Y SEGURO
+            nombre_final = f"{os.path.splitext(real)[0]}__{item['desc']}{os.path.splitext(real)[1]}" if item['desc'] else real
+
+            if nombre_final.lower() in mapa_archivos_drive:
+                item['subido'] = True
+                continue
+
+            ruta_final = os.path.join(carpeta, nombre_final)
+            try:
+                shutil.move(os.path.join(carpeta, real), ruta_final)
+                item['subido'] = yield from subir_archivo_rapido(drive_service, ruta_final, {'name': nombre_final, 'parents': [id_carpeta_destino]})
+            except Exception: pass  # No atrapar GeneratorExit: el planificador puede cerrar el flujo en la pausa
+    
+    driver.close(); driver.switch_to.window(ventana_principal)
+    logging.info(f"   -> ✨ [{id_mp}] CICLO COMPLETADO EXITOSAMENTE")
+    return True
+
+def procesar_lote(lote_datos, drive_service, worksheet, verificar=None):
     for licitacion in lote_datos:
         id_mp = licitacion['id_mp']
+        if verificar and not verificar(licitacion): continue
         logging.info(f"🔵 [{id_mp}] Iniciando proceso...")
+        PERFIL.inicio_licitacion(id_mp)
         
         intentos_max = Config.REINTENTOS_PROCESO
         exito = False
+        cola = []
 
         for intento in range(intentos_max):
             driver = None
@@ -335,170 +591,24 @@ def procesar_lote(lote_datos, drive_service, worksheet):
                 continue 
 
             try:
-                # --- PREPARACIÓN CARPETAS ---
-                id_carpeta_destino, link_carpeta, es_nueva = obtener_o_crear_carpeta_destino(drive_service, id_mp, Config.ID_CARPETA_DRIVE_DESTINO)
-                if link_carpeta: escribir_enlace_seguro(worksheet, id_mp, link_carpeta)
-
-                mapa_archivos_drive = {}
-                if id_carpeta_destino and not es_nueva:
-                      res = drive_service.files().list(q=f"'{id_carpeta_destino}' in parents and trashed=false", fields="files(id, name)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-                      for f in res.get('files', []): mapa_archivos_drive[f['name'].lower()] = f['id']
-
-                ventana_principal = driver.current_window_handle
-                
-                # --- NAVEGACIÓN ---
-                logging.info(f"   -> 🌍 Navegando a ficha...")
-                try:
-                    driver.get(licitacion['url_ficha'])
-                    espera_humana(2, 4)
-
-                    if "forbidden" in driver.title.lower() or "access denied" in driver.page_source.lower():
-                        raise Exception("Bloqueo 403 en Ficha Principal")
-
-                    manejar_alertas(driver)
-                    espera = WebDriverWait(driver, Config.SELENIUM_TIMEOUT)
-                    espera_humana(1, 2)
-                    
-                    try:
-                        btn_adj = espera.until(EC.element_to_be_clickable((By.ID, "imgAdjuntos")))
-                        btn_adj.click()
-                        
-                        espera.until(EC.number_of_windows_to_be(2))
-                        ventanas = driver.window_handles
-                        driver.switch_to.window([v for v in ventanas if v != ventana_principal][0])
-                        
-                        espera_humana(3, 5) 
-
-                        if "forbidden" in driver.title.lower() or "access denied" in driver.page_source.lower():
-                            raise Exception("Bloqueo 403 en Popup")
-
-                    except UnexpectedAlertPresentException:
-                        manejar_alertas(driver)
-                        logging.warning("   -> ⚠️ Alerta web detectada")
-                        raise 
-                    except Exception as e:
-                        if len(driver.window_handles) > 1: driver.close(); driver.switch_to.window(ventana_principal)
-                        logging.error(f"   -> ❌ Error abriendo adjuntos: {e}")
-                        raise 
-
-                    xpath_btns = "//input[contains(@id, 'DWNL_grdId') and @type='image']"
-                    try:
-                        espera.until(EC.presence_of_element_located((By.XPATH, xpath_btns)))
-                        btns = [e for e in driver.find_elements(By.XPATH, xpath_btns) if e.is_displayed()]
-                        if not btns: raise Exception("Sin botones")
-                    except:
-                        logging.warning("   -> Ø No se encontraron botones (Vacío/Timeout)")
-                        driver.close(); driver.switch_to.window(ventana_principal)
-                        raise 
-
-                    for f in os.listdir(CARPETA_TEMP):
-                        try: os.remove(os.path.join(CARPETA_TEMP, f))
-                        except: pass
-                    
-                    cola = []
-                    botones_a_clic = []
-
-                    # 1. SELECCIÓN
-                    for btn in btns:
-                        desc_limpia = ""
-                        try:
-                            celdas = btn.find_element(By.XPATH, "./ancestor::tr").find_elements(By.TAG_NAME, "td")
-                            if len(celdas) >= 5: 
-                                txt = celdas[4].text.strip()
-                                # USO DE LA FUNCIÓN DE SANITIZACIÓN SEGURA
-                                desc_limpia = limpiar_nombre_archivo(txt)[:80]
-                        except: pass
-
-                        if desc_limpia and len(desc_limpia) > 3:
-                            if any(desc_limpia.lower() in nom for nom in mapa_archivos_drive): continue 
-                        
-                        botones_a_clic.append((btn, desc_limpia))
-
-                    if not botones_a_clic:
-                        logging.info("   -> ✅ Sin archivos nuevos que descargar.")
-                        driver.close(); driver.switch_to.window(ventana_principal)
-                        exito = True; break
-
-                    logging.info(f"   -> ⬇️ Descargando {len(botones_a_clic)} archivos...")
-
-                    archivos_antes_del_loop = 0 
-                    contador_saturacion = 0 
-                    
-                    # 2. DESCARGA
-                    for btn, desc in botones_a_clic:
-                        if contador_saturacion > 0 and contador_saturacion % 5 == 0:
-                            wait_long = random.randint(10, 15)
-                            time.sleep(wait_long)
-                        
-                        contador_saturacion += 1
-                        
-                        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn)
-                        espera_humana(2.0, 4.0)
-                        
-                        try: btn.click()
-                        except: 
-                            try: ActionChains(driver).move_to_element(btn).click().perform()
-                            except: pass
-                        
-                        if manejar_alertas(driver): continue
-
-                        if esperar_nuevo_archivo(CARPETA_TEMP, archivos_antes_del_loop, timeout=25):
-                            time.sleep(1.0) 
-                            archivos_ahora = os.listdir(CARPETA_TEMP)
-                            archivos_en_cola = [c['temp'] for c in cola]
-                            nuevo_nombre = next((f for f in archivos_ahora if f not in archivos_en_cola), None)
-                            if nuevo_nombre:
-                                cola.append({"temp": nuevo_nombre, "desc": desc})
-                                archivos_antes_del_loop += 1
-                            else: logging.warning("      ? Archivo fantasma")
-                        else: logging.warning("      x Falló descarga de un archivo")
-                        
-                    # 3. SUBIDA
-                    esperar_fin_todas_descargas(CARPETA_TEMP, timeout=120)
-
-                    intentos_extra = 0
-                    while len(os.listdir(CARPETA_TEMP)) < len(botones_a_clic) and intentos_extra < 3:
-                        time.sleep(1); intentos_extra += 1
-                    
-                    logging.info("   -> ☁️ Subiendo a Drive...")
-
-                    archivos_disco = set(os.listdir(CARPETA_TEMP))
-                    
-                    for item in cola:
-                        base = item['temp'].replace('.crdownload', '').replace('.tmp', '')
-                        real = next((f for f in archivos_disco if f.startswith(base)), None)
-                        
-                        if real:
-                            if real in archivos_disco: archivos_disco.remove(real)
-                            # NOMBRE FINAL SANITIZADO Y SEGURO
-                            nombre_final = f"{os.path.splitext(real)[0]}__{item['desc']}{os.path.splitext(real)[1]}" if item['desc'] else real
-
-                            if nombre_final.lower() in mapa_archivos_drive: continue
-
-                            ruta_final = os.path.join(CARPETA_TEMP, nombre_final)
-                            try:
-                                shutil.move(os.path.join(CARPETA_TEMP, real), ruta_final)
-                                subir_archivo_rapido(drive_service, ruta_final, {'name': nombre_final, 'parents': [id_carpeta_destino]})
-                            except: pass
-                    
-                    driver.close(); driver.switch_to.window(ventana_principal)
-                    logging.info("   -> ✨ CICLO COMPLETADO EXITOSAMENTE")
-                    exito = True
-                    break 
+                pestana = {"principal": driver.current_window_handle, "carpeta": CARPETA_TEMP, "contexto": None}
+                exito = ejecutar_flujo(flujo_licitacion(driver, licitacion, pestana, drive_service, worksheet, cola))
+                break 
 
-                except Exception as e:
-                    logging.error(f"   -> ⚠️ ERROR EN EL PROCESO: {e}")
-                    if intento < intentos_max - 1:
-                        wait = random.randint(45, 90)
-                        logging.info(f"   -> Esperando {wait}s para reintentar...")
-                        time.sleep(wait)
-                        continue 
-                    else:
-                        logging.error("   -> 💀 FALLO FINAL. Se mantiene Prioridad 1.")
-                        actualizar_prioridad(worksheet, id_mp, "1")
+            except Exception as e:
+                logging.error(f"   -> ⚠️ ERROR EN EL PROCESO: {e}")
+                if intento < intentos_max - 1:
+                    wait = random.randint(45, 90)
+                    logging.info(f"   -> Esperando {wait}s para reintentar...")
+                    time.sleep(wait)
+                    continue 
+                else:
+                    logging.error("   -> 💀 FALLO FINAL. Se mantiene Prioridad 1.")
+                    actualizar_prioridad(worksheet, id_mp, "1")
 
             finally:
                 if driver:
+                    PERFIL.medir_navegador(id_mp)
                     try: driver.quit()
                     except: pass
                 if os.path.exists(CARPETA_TEMP):
@@ -507,13 +617,374 @@ def procesar_lote(lote_datos, drive_service, worksheet):
         
         if exito:
             actualizar_prioridad(worksheet, id_mp, "")
+        PERFIL.fin_licitacion(id_mp, cola=cola, exito=exito)
+
+# --- MODO MULTIPESTAÑA (--pestanas K) ---
+# Un solo Chromium atiende K licitaciones a la vez. Cada una vive en su propio contexto de
+# navegador (cookies aisladas, como un navegador nuevo) con su carpeta de descargas fijada por
+# CDP. El planificador avanza siempre la pestaña cuya pausa vence antes: mientras una espera
+# la carga de la página o una descarga, otra hace clic. La memoria extra es la de K renderers,
+# no la de K navegadores.
+# Limitación: las llamadas a Google siguen siendo síncronas. Mientras se sube un archivo
+# (files().create) o cuota_google.ejecutar espera un token o hace backoff por un 429, el
+# planificador no avanza ninguna pestaña. Solo la pausa entre reintentos de subida se cede.
+
+def _id_objetivo(handle):
+    # ChromeDriver usa el targetId de DevTools como handle (versiones antiguas con prefijo 'CDwindow-')
+    return handle.replace("CDwindow-", "").upper()
+
+def ventanas_de_pestana(driver, pestana):
+    """Handles de las ventanas de la pestaña (su ficha y su popup de adjuntos)."""
+    if pestana['contexto'] is None:
+        return driver.window_handles
+    objetivos = {t['targetId'].upper() for t in driver.execute_cdp_cmd("Target.getTargets", {})['targetInfos']
+                 if t['type'] == 'page' and t.get('browserContextId') == pestana['contexto']}
+    return [h for h in driver.window_handles if _id_objetivo(h) in objetivos]
+
+def abrir_pestana(driver, carpeta):
+    if not os.path.exists(carpeta): os.makedirs(carpeta)
+    for f in os.listdir(carpeta):
+        try: os.remove(os.path.join(carpeta, f))
+        except OSError as e: logging.warning(f"No se pudo borrar el archivo temporal {f}: {e}")
+
+    contexto = driver.execute_cdp_cmd("Target.createBrowserContext", {})['browserContextId']
+    objetivo = driver.execute_cdp_cmd("Target.createTarget", {"url": "about:blank", "browserContextId": contexto})['targetId']
+    # Las descargas del contexto (incluido el popup de adjuntos) van a la carpeta de esta pestaña
+    driver.execute_cdp_cmd("Browser.setDownloadBehavior", {"behavior": "allow", "downloadPath": os.path.abspath(carpeta), "browserContextId": contexto})
+
+    handle = next((h for h in driver.window_handles if _id_objetivo(h) == objetivo.upper()), None)
+    if not handle: raise Exception(f"ChromeDriver no expone la pestaña {objetivo}")
+    driver.switch_to.window(handle)
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": Config.SCRIPT_FURTIVO})
+    return {"principal": handle, "carpeta": carpeta, "contexto": contexto}
+
+def cerrar_pestana(driver, pestana, ventana_base):
+    try:
+        driver.switch_to.window(ventana_base)
+        driver.execute_cdp_cmd("Target.disposeBrowserContext", {"browserContextId": pestana['contexto']})
+    except Exception as e:
+        logging.warning(f"No se pudo cerrar el contexto de la pestaña: {e}")
+
+def cerrar_ventanas_extra(driver, pestana):
+    """Deja la pestaña solo con su ventana principal (antes de un reintento)."""
+    for handle in ventanas_de_pestana(driver, pestana):
+        if handle == pestana['principal']: continue
+        try: driver.switch_to.window(handle); driver.close()
+        except: pass
+    driver.switch_to.window(pestana['principal'])
+
+def tarea_licitacion(driver, licitacion, pestana, drive_service, worksheet, cola):
+    """flujo_licitacion con reintentos dentro de la misma pestaña (sin reiniciar el navegador)."""
+    id_mp = licitacion['id_mp']
+    intentos_max = Config.REINTENTOS_PROCESO
+
+    for intento in range(intentos_max):
+        try:
+            return (yield from flujo_licitacion(driver, licitacion, pestana, drive_service, worksheet, cola))
+        except Exception as e:
+            # Navegador caído: lo resuelve el planificador relanzándolo, no es un fallo de esta licitación
+            if not sesion_viva(driver): raise
+            logging.error(f"   -> ⚠️ [{id_mp}] ERROR EN EL PROCESO: {e}")
+            try: cerrar_ventanas_extra(driver, pestana)
+            except: pass
+            if intento < intentos_max - 1:
+                wait = random.randint(45, 90)
+                logging.info(f"   -> [{id_mp}] Esperando {wait}s para reintentar...")
+                yield wait
+            else:
+                logging.error(f"   -> 💀 [{id_mp}] FALLO FINAL. Se mantiene Prioridad 1.")
+                actualizar_prioridad(worksheet, id_mp, "1")
+    return False
+
+def sesion_viva(driver):
+    """False si Chromium/chromedriver murió (la sesión ya no responde a ningún comando)."""
+    try:
+        driver.window_handles
+        return True
+    except WebDriverException:
+        return False
+
+def marcar_fallo_final(worksheet, id_mp, motivo, cola=None):
+    """Deja la licitación con Prioridad 1 para la próxima corrida y cierra su registro de perfilado."""
+    logging.error(f"   -> 💀 [{id_mp}] FALLO FINAL ({motivo}). Se mantiene Prioridad 1.")
+    actualizar_prioridad(worksheet, id_mp, "1")
+    PERFIL.fin_licitacion(id_mp, cola=cola, exito=False)
+
+def procesar_lote_pestanas(lote_datos, drive_service, worksheet, num_pestanas, verificar=None):
+    pendientes = list(lote_datos)
+    driver = None
+    tareas = []
+    reinicios = 0
+    devoluciones = {}  # id_mp -> veces que volvió a la cola por una caída del navegador
+
+    try:
+        while pendientes or tareas:
+            if driver is None:
+                try:
+                    # 'none': driver.get() no bloquea; la carga se espera cooperativamente con pagina_cargada
+                    driver = iniciar_navegador(estrategia_carga='none')
+                except Exception as e:
+                    logging.error(f"💥 Error fatal al iniciar navegador: {e}")
+                    for licitacion in pendientes: marcar_fallo_final(worksheet, licitacion['id_mp'], "sin navegador")
+                    return
+                ventana_base = driver.current_window_handle
+                ranuras_libres = list(range(1, num_pestanas + 1))
+
+            caido = False
+
+            # Llenar las pestañas libres
+            while pendientes and ranuras_libres:
+                licitacion = pendientes.pop(0)
+                id_mp = licitacion['id_mp']
+                if verificar and not verificar(licitacion): continue
+                ranura = ranuras_libres.pop(0)
+                logging.info(f"🔵 [{id_mp}] Iniciando proceso en pestaña {ranura}...")
+                PERFIL.inicio_licitacion(id_mp)
+                try:
+                    pestana = abrir_pestana(driver, os.path.join(CARPETA_TEMP, f"pestana_{ranura}"))
+                except Exception as e:
+                    logging.error(f"[{id_mp}] 💥 Error al abrir pestaña: {e}")
+                    ranuras_libres.append(ranura)
+                    if not sesion_viva(driver):
+                        pendientes.insert(0, licitacion)  # Aún no empezó: vuelve tal cual
+                        caido = True
+                        break
+                    marcar_fallo_final(worksheet, id_mp, "no se pudo abrir la pestaña")
+                    continue
+                cola = []
+                tareas.append({
+                    "licitacion": licitacion, "ranura": ranura, "pestana": pestana, "cola": cola,
+                    "ventana": pestana['principal'], "listo_en": 0,
+                    "flujo": tarea_licitacion(driver, licitacion, pestana, drive_service, worksheet, cola),
+                })
+
+            if tareas and not caido:
+                # Avanzar la pestaña cuya pausa vence antes
+                tarea = min(tareas, key=lambda t: t['listo_en'])
+                id_mp = tarea['licitacion']['id_mp']
+                pausa = tarea['listo_en'] - time.time()
+                if pausa > 0: time.sleep(pausa)
+
+                terminada = True
+                try:
+                    driver.switch_to.window(tarea['ventana'])
+                    segundos = next(tarea['flujo'])
+                    tarea['ventana'] = driver.current_window_handle
+                    tarea['listo_en'] = time.time() + segundos
+                    terminada = False
+                except StopIteration as fin:
+                    exito = bool(fin.value)
+                except Exception as e:
+                    if not sesion_viva(driver):
+                        logging.error(f"   -> [{id_mp}] Navegador caído: {e}")
+                        caido = True
+                        terminada = False
+                    else:
+                        marcar_fallo_final(worksheet, id_mp, f"pestaña {tarea['ranura']}: {e}", tarea['cola'])
+                        tareas.remove(tarea)
+                        cerrar_pestana(driver, tarea['pestana'], ventana_base)
+                        ranuras_libres.append(tarea['ranura'])
+                        terminada = False
+
+                if terminada:
+                    # Licitación terminada: liberar la pestaña
+                    tareas.remove(tarea)
+                    PERFIL.medir_navegador(id_mp)
+                    cerrar_pestana(driver, tarea['pestana'], ventana_base)
+                    ranuras_libres.append(tarea['ranura'])
+                    if exito:
+                        actualizar_prioridad(worksheet, id_mp, "")
+                    PERFIL.fin_licitacion(id_mp, cola=tarea['cola'], exito=exito)
+
+            if not caido: continue
+
+            # --- NAVEGADOR CAÍDO: se relanza y las licitaciones en curso vuelven a la cola ---
+            reinicios += 1
+            logging.error(f"💥 El navegador dejó de responder ({reinicios}/{Config.MAX_REINICIOS_NAVEGADOR} reinicios en este lote).")
+            for tarea in reversed(tareas):
+                tarea['flujo'].close()
+                id_mp = tarea['licitacion']['id_mp']
+                devoluciones[id_mp] = devoluciones.get(id_mp, 0) + 1
+                if devoluciones[id_mp] > Config.DEVOLUCIONES_POR_CAIDA:
+                    marcar_fallo_final(worksheet, id_mp, "el navegador cayó otra vez", tarea['cola'])
+                else:
+                    pendientes.insert(0, tarea['licitacion'])
+            tareas = []
+            try: driver.quit()
+            except: pass
+            driver = None
+
+            if reinicios > Config.MAX_REINICIOS_NAVEGADOR:
+                for licitacion in pendientes: marcar_fallo_final(worksheet, licitacion['id_mp'], "demasiados reinicios del navegador")
+                return
+
+    finally:
+        if driver:
+            try: driver.quit()
+            except: pass
+        if os.path.exists(CARPETA_TEMP):
+            try: shutil.rmtree(CARPETA_TEMP, ignore_errors=True)
+            except: pass
+
+def procesar_segun_modo(lote_datos, drive_service, worksheet, verificar=None):
+    """'verificar(licitacion)' se llama justo antes de empezar cada una; si devuelve False se omite."""
+    if ARGS.pestanas > 1:
+        procesar_lote_pestanas(lote_datos, drive_service, worksheet, ARGS.pestanas, verificar)
+    else:
+        procesar_lote(lote_datos, drive_service, worksheet, verificar)
             
+# --- ARRIENDO DE FILAS ENTRE RUNNERS (--arriendo) ---
+# En vez de repartir por --lote/--total_lotes, cada runner toma filas escribiendo en la
+# columna de arriendo "<runner>|<expira_epoch>" (un solo batch_update por tanda), lo renueva
+# desde un hilo mientras trabaja y al terminar deja "HECHO|<epoch>". Las filas con arriendo
+# vencido (runner caído) quedan libres para cualquier otro host.
+#
+# Sheets no tiene escritura condicional, así que la propiedad se confirma leyendo de vuelta
+# tras reclamar y otra vez justo antes de empezar cada licitación. Queda una ventana mínima:
+# si otro runner leyó la hoja antes de nuestra escritura y escribe su reclamo después de
+# nuestra última verificación, ambos procesan la fila (el proceso es idempotente: no se
+# vuelven a subir archivos que ya están en Drive).
+#
+# Las filas se ubican siempre por ID, nunca solo por número: si alguien inserta, borra u
+# ordena filas durante la corrida, las renovaciones y liberaciones siguen a su licitación.
+
+ID_RUNNER = f"{socket.gethostname()}-{os.getpid()}-{random.randint(1000, 9999)}"
+
+def arriendo_disponible(valor, ahora):
+    if not valor: return True
+    dueno, _, marca = valor.partition("|")
+    try: marca = float(marca)
+    except ValueError: return True  # Valor ilegible: se considera libre
+    if dueno == "HECHO":
+        return ahora - marca > Config.ENFRIAMIENTO_ARRIENDO
+    return marca < ahora
+
+def _valor_columna(fila, columna):
+    return fila[columna - 1].strip() if fila and len(fila) >= columna else ""
+
+def es_arriendo_propio(fila):
+    return _valor_columna(fila, Config.COLUMNA_ARRIENDO).startswith(f"{ID_RUNNER}|")
+
+def ubicar_fila(datos, licitacion):
+    """Devuelve la fila actual de la licitación en 'datos' (get_all_values). Si la fila se movió,
+    la busca por ID y actualiza licitacion['fila']. None si el ID ya no está en la hoja."""
+    n = licitacion['fila']
+    if len(datos) >= n and _valor_columna(datos[n - 1], Config.COLUMNA_ID) == licitacion['id_mp']:
+        return datos[n - 1]
+    for i, fila in enumerate(datos[1:]):
+        if _valor_columna(fila, Config.COLUMNA_ID) == licitacion['id_mp']:
+            licitacion['fila'] = i + 2
+            return fila
+    return None
+
+def escribir_arriendos(worksheet, filas, valor):
+    """Escribe el mismo valor en la columna de arriendo de varias filas con un único batch_update."""
+    if not filas: return
+    cambios = [{"range": rowcol_to_a1(fila, Config.COLUMNA_ARRIENDO), "values": [[valor]]} for fila in filas]
+    cuota_google.ejecutar("sheets_escritura", worksheet.batch_update, cambios)
+
+def actualizar_arriendos_propios(worksheet, licitaciones, valor):
+    """Reescribe el arriendo solo de las licitaciones que siguen siendo de este runner."""
+    if not licitaciones: return []
+    datos = cuota_google.ejecutar("sheets_lectura", worksheet.get_all_values)
+    propias = [d for d in licitaciones if es_arriendo_propio(ubicar_fila(datos, d))]
+    escribir_arriendos(worksheet, [d['fila'] for d in propias], valor)
+    return propias
+
+def arriendo_vigente(worksheet, licitacion):
+    """Verificación justo antes de empezar una licitación: lee solo su fila (o toda la hoja si se movió)."""
+    fila = cuota_google.ejecutar("sheets_lectura", worksheet.row_values, licitacion['fila'])
+    if _valor_columna(fila, Config.COLUMNA_ID) != licitacion['id_mp']:
+        fila = ubicar_fila(cuota_google.ejecutar("sheets_lectura", worksheet.get_all_values), licitacion)
+    if es_arriendo_propio(fila): return True
+    logging.warning(f"🤝 [{licitacion['id_mp']}] El arriendo ya no es de este runner. Se omite.")
+    return False
+
+def reclamar_filas(worksheet, drive_service, excluir, cantidad):
+    """Toma hasta 'cantidad' filas libres o vencidas (nuevas primero, luego prioritarias)."""
+    datos = cuota_google.ejecutar("sheets_lectura", worksheet.get_all_values)
+    lista, _ = parsear_licitaciones(datos)
+    # "Nuevo" se decide con Drive al día: lo que terminó cualquier runner ya tiene carpeta
+    carpetas_drive = obtener_nombres_carpetas_existentes(drive_service)
+    ahora = time.time()
+
+    libres = [d for d in lista if d['id_mp'] not in excluir and arriendo_disponible(d['arriendo'], ahora)]
+    nuevos = [d for d in libres if d['id_mp'] not in carpetas_drive]
+    prioritarios = [d for d in libres if d['id_mp'] in carpetas_drive and d['prioridad'] == "1"]
+    elegidos = (nuevos + prioritarios)[:cantidad]
+    if not elegidos: return []
+
+    marca = f"{ID_RUNNER}|{int(ahora + Config.DURACION_ARRIENDO)}"
+    escribir_arriendos(worksheet, [d['fila'] for d in elegidos], marca)
+
+    # Si dos runners reclaman a la vez gana el último en escribir. Tras una pausa (para que
+    # aterricen escrituras concurrentes) nos quedamos solo con las filas que siguen a nuestro nombre.
+    time.sleep(Config.ESPERA_VERIFICACION_ARRIENDO)
+    datos = cuota_google.ejecutar("sheets_lectura", worksheet.get_all_values)
+    propios = [d for d in elegidos if _valor_columna(ubicar_fila(datos, d), Config.COLUMNA_ARRIENDO) == marca]
+
+    if len(propios) < len(elegidos):
+        logging.info(f"🤝 {len(elegidos) - len(propios)} filas quedaron para otro runner.")
+    return propios
+
+def iniciar_renovacion(worksheet, tomadas, candado, detener):
+    """Hilo que renueva el arriendo de las filas tomadas cada DURACION_ARRIENDO / 3.
+    Escribe con el candado tomado para no pisar una liberación concurrente."""
+    def bucle():
+        while not detener.wait(Config.DURACION_ARRIENDO / 3):
+            with candado:
+                if not tomadas: continue
+                try:
+                    renovadas = actualizar_arriendos_propios(worksheet, list(tomadas.values()), f"{ID_RUNNER}|{int(time.time() + Config.DURACION_ARRIENDO)}")
+                    logging.info(f"🤝 Arriendo renovado para {len(renovadas)} filas.")
+                except Exception as e:
+                    logging.warning(f"No se pudo renovar el arriendo: {e}")
+
+    hilo = threading.Thread(target=bucle, daemon=True)
+    hilo.start()
+    return hilo
+
+def procesar_con_arriendo(worksheet, drive_service):
+    cantidad = max(Config.TAMANO_ARRIENDO, ARGS.pestanas)
+    tomadas = {}        # id_mp -> licitación con arriendo vigente de este runner
+    ya_procesadas = set()  # No se vuelven a tomar en esta corrida aunque venza el enfriamiento
+    candado = threading.Lock()
+    detener = threading.Event()
+    iniciar_renovacion(worksheet, tomadas, candado, detener)
+    procesadas = 0
+
+    try:
+        while True:
+            lote = reclamar_filas(worksheet, drive_service, ya_procesadas, cantidad)
+            if not lote: break
+            with candado: tomadas.update((d['id_mp'], d) for d in lote)
+            logging.info(f"🤝 Runner {ID_RUNNER} tomó {len(lote)} filas.")
+
+            try:
+                procesar_segun_modo(lote, drive_service, worksheet, verificar=lambda d: arriendo_vigente(worksheet, d))
+                valor_final = f"HECHO|{int(time.time())}"
+            except BaseException:
+                valor_final = ""  # Interrumpido: se libera para que otro runner la tome de inmediato
+                raise
+            finally:
+                with candado:
+                    for d in lote: tomadas.pop(d['id_mp'], None)
+                    try: actualizar_arriendos_propios(worksheet, lote, valor_final)
+                    except Exception as e: logging.error(f"No se pudo liberar el arriendo (vencerá solo): {e}")
+
+            ya_procesadas.update(d['id_mp'] for d in lote)
+            procesadas += len(lote)
+            gc.collect()
+    finally:
+        detener.set()
+    return procesadas
+
 def filtrar_datos_para_lote(lista_completa, indice_lote, total_lotes):
     if not lista_completa: return []
     sub_lista = [item for i, item in enumerate(lista_completa) if i % total_lotes == (indice_lote - 1)]
     return sub_lista
 
-def main():
+def ejecutar_bot():
     mi_lote = ARGS.lote
     total_bots = ARGS.total_lotes
 
@@ -528,28 +999,36 @@ def main():
     prioritarios_total = [d for d in existentes_todos if d.get("prioridad") == "1"]
     existentes_normales_total = [d for d in existentes_todos if d.get("prioridad") != "1"]
 
-    mis_nuevos = filtrar_datos_para_lote(nuevos_total, mi_lote, total_bots)
-    mis_prioritarios = filtrar_datos_para_lote(prioritarios_total, mi_lote, total_bots)
-    mis_existentes = filtrar_datos_para_lote(existentes_normales_total, mi_lote, total_bots)
-
-    print(f"📊 RESUMEN DE TRABAJO:")
-    print(f"   - Nuevos:       {len(mis_nuevos)}")
-    print(f"   - Prioritarios: {len(mis_prioritarios)}")
-    
-    if mis_nuevos:
-        print(f"\n🚀 PROCESANDO NUEVOS...")
-        for i in range(0, len(mis_nuevos), Config.TAMANO_LOTE):
-            procesar_lote(mis_nuevos[i:i+Config.TAMANO_LOTE], drive_service, worksheet)
-            gc.collect()
-    
-    if mis_prioritarios:
-        print(f"\n🔥 PROCESANDO PRIORITARIOS...")
-        for i in range(0, len(mis_prioritarios), Config.TAMANO_LOTE):
-            procesar_lote(mis_prioritarios[i:i+Config.TAMANO_LOTE], drive_service, worksheet)
-            gc.collect()
+    if ARGS.arriendo:
+        print(f"📊 RESUMEN DE LA HOJA (compartida por arriendo, runner {ID_RUNNER}):")
+        print(f"   - Nuevos:       {len(nuevos_total)}")
+        print(f"   - Prioritarios: {len(prioritarios_total)}")
+        print(f"\n🤝 PROCESANDO POR ARRIENDO...")
+        procesadas = procesar_con_arriendo(worksheet, drive_service)
+        print(f"   - Procesadas por este runner: {procesadas}")
+    else:
+        mis_nuevos = filtrar_datos_para_lote(nuevos_total, mi_lote, total_bots)
+        mis_prioritarios = filtrar_datos_para_lote(prioritarios_total, mi_lote, total_bots)
+        mis_existentes = filtrar_datos_para_lote(existentes_normales_total, mi_lote, total_bots)
+
+        print(f"📊 RESUMEN DE TRABAJO:")
+        print(f"   - Nuevos:       {len(mis_nuevos)}")
+        print(f"   - Prioritarios: {len(mis_prioritarios)}")
+        
+        if mis_nuevos:
+            print(f"\n🚀 PROCESANDO NUEVOS...")
+            for i in range(0, len(mis_nuevos), Config.TAMANO_LOTE):
+                procesar_segun_modo(mis_nuevos[i:i+Config.TAMANO_LOTE], drive_service, worksheet)
+                gc.collect()
+        
+        if mis_prioritarios:
+            print(f"\n🔥 PROCESANDO PRIORITARIOS...")
+            for i in range(0, len(mis_prioritarios), Config.TAMANO_LOTE):
+                procesar_segun_modo(mis_prioritarios[i:i+Config.TAMANO_LOTE], drive_service, worksheet)
+                gc.collect()
 
-    # Si hay existentes y quieres revisarlos, descomenta esto (consume mucho tiempo)
-    # if mis_existentes: ...
+        # Si hay existentes y quieres revisarlos, descomenta esto (consume mucho tiempo)
+        # if mis_existentes: ...
 
     if mi_lote == 1:
         logging.info("\n[Bot 1] Ejecutando limpieza final...")
@@ -557,5 +1036,14 @@ def main():
 
     print(f"\n✅ TERMINADO TOTAL.")
 
+def main():
+    # Actions cancela o vence el job con SIGTERM: se convierte en SystemExit para que corran los finally
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(143))
+    try:
+        ejecutar_bot()
+    finally:
+        cuota_google.reportar()
+        PERFIL.finalizar()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,336 @@
+import os
+import io
+import sys
+import gc
+import time
+import json
+import pstats
+import logging
+import cProfile
+import atexit
+import threading
+import tracemalloc
+from collections import Counter
+from selenium.webdriver.remote.webelement import WebElement
+
+# --- PERFILADO OPCIONAL (--perfil) ---
+# Mide cada licitación para detectar crecimiento de memoria en corridas largas:
+#   - tracemalloc (memoria Python) y RSS del proceso + hijos (chromedriver / Chromium)
+#   - referencias vivas a WebElement, descargas de la cola que no llegaron a Drive y descriptores abiertos
+#   - cProfile o muestreo de pila para las licitaciones seleccionadas
+# Cada licitación se agrega a licitaciones.jsonl apenas termina (sobrevive a un timeout o SIGKILL);
+# al cerrar se escribe reporte.json. Se comparan con: python perfilado.py comparar A B
+
+class ConfigPerfil:
+    FRAMES_TRACEMALLOC = 10
+    TOP_CRECIMIENTO = 10          # Líneas de código con más crecimiento por licitación
+    TOP_CPROFILE = 30
+    INTERVALO_MUESTREO = 0.01     # Segundos entre muestras del perfilador de muestreo
+    INTERVALO_RSS = 2.0           # Segundos entre muestras del RSS del navegador (pico real durante descargas)
+
+    # Una métrica se marca como fuga si sube en al menos esta fracción de los pasos...
+    FRACCION_SUBIDAS = 0.75
+    MINIMO_MUESTRAS = 3
+    # ...y su valor final supera al inicial en más de este umbral
+    UMBRALES_FUGA = {
+        "webelements_vivos": 0,
+        "archivos_abiertos": 2,
+        "rss_python_kb": 20480,
+        "tracemalloc_kb": 10240,
+    }
+    # Métricas que deberían quedar en 0 al terminar cada licitación: cualquier valor es un residuo
+    METRICAS_CERO = ("cola_sin_subir",)
+
+# --- MEDICIONES DEL SISTEMA (Linux /proc, sin dependencias extra) ---
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def _descendientes(pid_raiz):
+    """PIDs de todos los procesos descendientes (chromedriver, Chromium y sus renderers)."""
+    hijos = {}
+    for nombre in os.listdir("/proc"):
+        if not nombre.isdigit(): continue
+        try:
+            with open(f"/proc/{nombre}/stat") as f:
+                # El campo 'comm' va entre paréntesis y puede contener espacios
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            hijos.setdefault(ppid, []).append(int(nombre))
+        except (OSError, ValueError, IndexError):
+            continue
+
+    encontrados, pendientes = [], [pid_raiz]
+    while pendientes:
+        for hijo in hijos.get(pendientes.pop(), []):
+            encontrados.append(hijo)
+            pendientes.append(hijo)
+    return encontrados
+
+def _archivos_abiertos():
+    try: return len(os.listdir("/proc/self/fd"))
+    except OSError: return -1
+
+def _webelements_vivos():
+    return sum(1 for o in gc.get_objects() if isinstance(o, WebElement))
+
+# --- PERFILADOR DE MUESTREO ---
+
+class MuestreadorPila:
+    """Toma la pila del hilo principal cada cierto intervalo y la acumula en formato 'folded'
+    (compatible con flamegraph.pl / speedscope)."""
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._hilo_objetivo = threading.main_thread().ident
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo: self._hilo.join()
+
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo):
+            frame = sys._current_frames().get(self._hilo_objetivo)
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if pila: self.pilas[";".join(reversed(pila))] += 1
+
+    def guardar(self, ruta):
+        with open(ruta, "w") as f:
+            for pila, n in self.pilas.most_common():
+                f.write(f"{pila} {n}\n")
+
+# --- PERFILADOR PRINCIPAL ---
+
+class Perfilador:
+    def __init__(self, activo=False, carpeta="reportes_perfil", ids_cpu=None, modo_cpu="ninguno", etiqueta=""):
+        self.activo = activo
+        if not activo: return
+
+        self.modo_cpu = modo_cpu
+        self.ids_cpu = set(ids_cpu or [])
+        self.inicio = time.time()
+        nombre = time.strftime("perfil_%Y%m%d_%H%M%S", time.localtime(self.inicio)) + (f"_{etiqueta}" if etiqueta else "")
+        self.carpeta = os.path.join(carpeta, nombre)
+        os.makedirs(self.carpeta, exist_ok=True)
+
+        self.registros = []
+        self._actual = {}
+        self._cpu_activo = None   # (id_mp, perfilador) — solo un perfil de CPU a la vez
+        self._snapshot_previo = None
+        self._candado = threading.Lock()
+        self._finalizado = False
+
+        self._cabecera = {"inicio": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.inicio)), "argv": sys.argv[1:]}
+        self._ruta_jsonl = os.path.join(self.carpeta, "licitaciones.jsonl")
+        with open(self._ruta_jsonl, "w") as f: f.write(json.dumps(self._cabecera, ensure_ascii=False) + "\n")
+        atexit.register(self.finalizar)
+
+        tracemalloc.start(ConfigPerfil.FRAMES_TRACEMALLOC)
+        self._detener_rss = threading.Event()
+        threading.Thread(target=self._bucle_rss, daemon=True).start()
+        logging.info(f"🔬 [Perfil] Modo perfilado activo. Reportes en {self.carpeta}")
+
+    def _perfilar_cpu(self, id_mp):
+        if self.modo_cpu == "ninguno": return False
+        return not self.ids_cpu or id_mp in self.ids_cpu
+
+    def inicio_licitacion(self, id_mp):
+        if not self.activo: return
+        with self._candado:
+            self._actual[id_mp] = {"id_mp": id_mp, "inicio": time.time(), "rss_navegador_kb": 0, "procesos_navegador": 0}
+
+        if self._perfilar_cpu(id_mp):
+            if self._cpu_activo:
+                logging.warning(f"🔬 [Perfil] CPU de {id_mp} no perfilada: ya hay un perfil activo ({self._cpu_activo[0]}).")
+            elif self.modo_cpu == "cprofile":
+                perfil = cProfile.Profile()
+                perfil.enable()
+                self._cpu_activo = (id_mp, perfil)
+            else:
+                muestreador = MuestreadorPila(ConfigPerfil.INTERVALO_MUESTREO)
+                muestreador.iniciar()
+                self._cpu_activo = (id_mp, muestreador)
+
+    def _bucle_rss(self):
+        """Muestrea el RSS del navegador periódicamente mientras haya licitaciones en curso."""
+        while not self._detener_rss.wait(ConfigPerfil.INTERVALO_RSS):
+            with self._candado: ids = list(self._actual)
+            if ids: self.medir_navegador(*ids)
+
+    def medir_navegador(self, *ids_mp):
+        """Suma el RSS de todos los procesos hijos y actualiza el máximo de las licitaciones indicadas."""
+        if not self.activo: return
+        pids = _descendientes(os.getpid())
+        rss = sum(_rss_kb(p) for p in pids)
+        with self._candado:
+            for id_mp in ids_mp:
+                registro = self._actual.get(id_mp)
+                if registro and rss > registro["rss_navegador_kb"]:
+                    registro["rss_navegador_kb"] = rss
+                    registro["procesos_navegador"] = len(pids)
+
+    def fin_licitacion(self, id_mp, cola=None, exito=None):
+        if not self.activo: return
+        with self._candado: registro = self._actual.pop(id_mp, None)
+        if registro is None: return
+
+        if self._cpu_activo and self._cpu_activo[0] == id_mp:
+            self._guardar_cpu(id_mp, self._cpu_activo[1])
+            self._cpu_activo = None
+
+        gc.collect()
+        actual, pico = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        crecimiento = []
+        if self._snapshot_previo is not None:
+            for stat in snapshot.compare_to(self._snapshot_previo, "lineno")[:ConfigPerfil.TOP_CRECIMIENTO]:
+                crecimiento.append({"linea": str(stat.traceback), "delta_kb": round(stat.size_diff / 1024, 1), "total_kb": round(stat.size / 1024, 1)})
+        self._snapshot_previo = snapshot
+        tracemalloc.reset_peak()
+
+        registro.update({
+            "duracion_seg": round(time.time() - registro.pop("inicio"), 1),
+            "exito": exito,
+            "rss_python_kb": _rss_kb(os.getpid()),
+            "tracemalloc_kb": round(actual / 1024, 1),
+            "tracemalloc_pico_kb": round(pico / 1024, 1),
+            "webelements_vivos": _webelements_vivos(),
+            # Entradas de la cola que nunca llegaron a Drive (ni subidas ni ya existentes)
+            "cola_sin_subir": sum(1 for c in cola if not c.get("subido")) if cola is not None else 0,
+            "archivos_abiertos": _archivos_abiertos(),
+            "crecimiento_top": crecimiento,
+        })
+        self.registros.append(registro)
+        with open(self._ruta_jsonl, "a") as f: f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        logging.info(f"🔬 [Perfil] {id_mp}: RSS py {registro['rss_python_kb']} kB | navegador {registro['rss_navegador_kb']} kB "
+                     f"| tracemalloc {registro['tracemalloc_kb']} kB | WebElements {registro['webelements_vivos']} | fds {registro['archivos_abiertos']}")
+
+    def _guardar_cpu(self, id_mp, perfilador):
+        base = os.path.join(self.carpeta, f"cpu_{id_mp}")
+        if isinstance(perfilador, cProfile.Profile):
+            perfilador.disable()
+            perfilador.dump_stats(base + ".prof")
+            texto = io.StringIO()
+            pstats.Stats(perfilador, stream=texto).sort_stats("cumulative").print_stats(ConfigPerfil.TOP_CPROFILE)
+            with open(base + ".txt", "w") as f: f.write(texto.getvalue())
+        else:
+            perfilador.detener()
+            perfilador.guardar(base + ".folded")
+
+    def finalizar(self):
+        """Escribe reporte.json. Idempotente: se llama desde el 'finally' de main() y desde atexit."""
+        if not self.activo or self._finalizado: return None
+        self._finalizado = True
+        self._detener_rss.set()
+        if self._cpu_activo:
+            self._guardar_cpu(*self._cpu_activo)
+            self._cpu_activo = None
+        tracemalloc.stop()
+
+        with self._candado: interrumpidas = list(self._actual)
+        reporte = armar_reporte(self._cabecera, self.registros, round(time.time() - self.inicio, 1), interrumpidas)
+        ruta = os.path.join(self.carpeta, "reporte.json")
+        with open(ruta, "w") as f: json.dump(reporte, f, indent=2, ensure_ascii=False)
+
+        for alerta in reporte["alertas_fuga"]:
+            logging.warning(f"🔬 [Perfil] ⚠️ Posible fuga en '{alerta['metrica']}': {alerta['detalle']}")
+        if interrumpidas:
+            logging.warning(f"🔬 [Perfil] Licitaciones sin terminar al cerrar: {', '.join(interrumpidas)}")
+        logging.info(f"🔬 [Perfil] Reporte guardado en {ruta}")
+        return ruta
+
+# --- REPORTE ---
+
+def detectar_fugas(registros):
+    alertas = []
+    for metrica, umbral in ConfigPerfil.UMBRALES_FUGA.items():
+        valores = [r[metrica] for r in registros]
+        if len(valores) < ConfigPerfil.MINIMO_MUESTRAS: continue
+        subidas = sum(1 for a, b in zip(valores, valores[1:]) if b > a)
+        if subidas >= ConfigPerfil.FRACCION_SUBIDAS * (len(valores) - 1) and valores[-1] - valores[0] > umbral:
+            alertas.append({"metrica": metrica, "inicial": valores[0], "final": valores[-1],
+                            "detalle": f"{valores[0]} -> {valores[-1]} ({subidas}/{len(valores) - 1} subidas)"})
+    for metrica in ConfigPerfil.METRICAS_CERO:
+        con_residuo = [r["id_mp"] for r in registros if r[metrica] > 0]
+        if con_residuo:
+            total = sum(r[metrica] for r in registros)
+            alertas.append({"metrica": metrica, "inicial": 0, "final": total,
+                            "detalle": f"{total} en {len(con_residuo)} licitaciones ({', '.join(con_residuo[:5])}{'...' if len(con_residuo) > 5 else ''})"})
+    return alertas
+
+def armar_reporte(cabecera, registros, duracion_seg, interrumpidas=()):
+    def _max(campo): return max((r[campo] for r in registros), default=0)
+    return {
+        **cabecera,
+        "duracion_seg": duracion_seg,
+        "resumen": {
+            "licitaciones": len(registros),
+            "rss_python_max_kb": _max("rss_python_kb"),
+            "rss_navegador_max_kb": _max("rss_navegador_kb"),
+            "tracemalloc_max_kb": _max("tracemalloc_kb"),
+            "webelements_max": _max("webelements_vivos"),
+            "archivos_abiertos_max": _max("archivos_abiertos"),
+            "cola_sin_subir_total": sum(r["cola_sin_subir"] for r in registros),
+            "duracion_media_seg": round(sum(r["duracion_seg"] for r in registros) / len(registros), 1) if registros else 0,
+        },
+        "alertas_fuga": detectar_fugas(registros),
+        "interrumpidas": list(interrumpidas),
+        "licitaciones": registros,
+    }
+
+def cargar_reporte(ruta):
+    """Acepta reporte.json o, si la corrida murió sin cerrarlo (SIGKILL, OOM), licitaciones.jsonl."""
+    if not ruta.endswith(".jsonl"):
+        with open(ruta) as f: return json.load(f)
+    with open(ruta) as f:
+        lineas = [json.loads(l) for l in f if l.strip()]
+    cabecera, registros = lineas[0], lineas[1:]
+    return armar_reporte(cabecera, registros, sum(r["duracion_seg"] for r in registros))
+
+# --- COMPARACIÓN ENTRE EJECUCIONES ---
+
+def comparar(ruta_a, ruta_b):
+    a = cargar_reporte(ruta_a)
+    b = cargar_reporte(ruta_b)
+
+    print(f"\n📊 COMPARACIÓN DE PERFILES\n   A: {ruta_a} ({a['inicio']})\n   B: {ruta_b} ({b['inicio']})\n")
+    for clave, valor_a in a["resumen"].items():
+        valor_b = b["resumen"].get(clave, 0)
+        delta = valor_b - valor_a
+        print(f"   {clave:<24} {valor_a:>12} -> {valor_b:>12}  ({'+' if delta >= 0 else ''}{round(delta, 1)})")
+
+    por_id_a = {r["id_mp"]: r for r in a["licitaciones"]}
+    comunes = [r for r in b["licitaciones"] if r["id_mp"] in por_id_a]
+    if comunes:
+        print(f"\n   Licitaciones en ambas ejecuciones: {len(comunes)}")
+        for r in comunes:
+            ra = por_id_a[r["id_mp"]]
+            print(f"   - {r['id_mp']}: duración {ra['duracion_seg']}s -> {r['duracion_seg']}s | navegador {ra['rss_navegador_kb']} -> {r['rss_navegador_kb']} kB")
+
+    print()
+    for nombre, reporte in (("A", a), ("B", b)):
+        for alerta in reporte["alertas_fuga"]:
+            print(f"   ⚠️ [{nombre}] Posible fuga en '{alerta['metrica']}': {alerta['detalle']}")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "comparar":
+        comparar(sys.argv[2], sys.argv[3])
+    else:
+        print("Uso: python perfilado.py comparar <reporte_A.json|licitaciones.jsonl> <reporte_B.json|licitaciones.jsonl>")